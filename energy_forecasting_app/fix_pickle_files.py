@@ -3,8 +3,11 @@ Script to fix and regenerate pickle files for the energy forecasting model
 """
 
 import pickle
+import joblib
+import msgspec
 import pandas as pd
 import os
+import struct
 import sys
 
 # Add the current directory to Python path
@@ -15,19 +18,60 @@ def create_features(df):
     """
     Create time series features based on time series index.
     """
-    df = df.copy()
-    df['hour'] = df.index.hour
-    df['dayofweek'] = df.index.dayofweek
-    df['quarter'] = df.index.quarter
-    df['month'] = df.index.month
-    df['year'] = df.index.year
-    df['dayofyear'] = df.index.dayofyear
-    df['dayofmonth'] = df.index.day
-    df['weekofyear'] = df.index.isocalendar().week
-    return df
-
-# Load the existing model (this should work)
-models_path = r"F:\bda-project\models"
+    idx = df.index
+
+    # Single-row inputs (the single-datetime prediction path) read the fields
+    # straight off the Timestamp instead of going through DatetimeIndex ops
+    if len(idx) == 1:
+        ts = idx[0]
+        return df.assign(
+            hour=ts.hour,
+            dayofweek=ts.dayofweek,
+            quarter=ts.quarter,
+            month=ts.month,
+            year=ts.year,
+            dayofyear=ts.dayofyear,
+            dayofmonth=ts.day,
+            weekofyear=ts.isocalendar()[1]
+        )
+
+    fields = {
+        'hour': idx.hour.values,
+        'dayofweek': idx.dayofweek.values,
+        'quarter': idx.quarter.values,
+        'month': idx.month.values,
+        'year': idx.year.values,
+        'dayofyear': idx.dayofyear.values,
+        'dayofmonth': idx.day.values,
+        'weekofyear': idx.isocalendar().week.values.astype('int64')
+    }
+    # assign() already returns a new frame, so no defensive copy is needed
+    return df.assign(**fields)
+
+def write_to_temp(path, write):
+    """Write a file next to path via write(tmp_path) and return the temp path.
+    
+    The caller moves it into place with os.replace, so a failed or
+    interrupted save never leaves a truncated file at path.
+    """
+    tmp_path = path + '.tmp'
+    try:
+        write(tmp_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path
+
+# Load the existing model (this should work). The models directory sits
+# next to this app, as in EnergyForecastingModel; pass another path as
+# the first argument to convert a different copy.
+if len(sys.argv) > 1:
+    models_path = os.path.abspath(sys.argv[1])
+else:
+    models_path = os.path.abspath(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models')
+    )
 
 try:
     print("Loading existing model...")
@@ -40,13 +84,63 @@ try:
         config = pickle.load(f)
     print("Config loaded successfully")
     
-    # Save the function with proper module context
-    print("Saving feature function...")
-    with open(os.path.join(models_path, 'create_features.pkl'), 'wb') as f:
-        pickle.dump(create_features, f)
-    print("Feature function saved successfully")
+    # The feature function is no longer pickled; the apps use the one in
+    # utils/model_utils.py. Remove any stale copy left by older versions.
+    stale_features_path = os.path.join(models_path, 'create_features.pkl')
+    if os.path.exists(stale_features_path):
+        os.remove(stale_features_path)
+        print("Removed stale create_features.pkl")
+    
+    # Save the config as msgpack so loading it never runs the pickle VM
+    print("Saving model config as msgpack...")
+    config['feature_importance'] = {k: float(v) for k, v in config['feature_importance'].items()}
+    config_path = os.path.join(models_path, 'model_config.msgpack')
+    def write_config(path):
+        with open(path, 'wb') as f:
+            f.write(msgspec.msgpack.encode(config))
+    os.replace(write_to_temp(config_path, write_config), config_path)
+    print("Config saved successfully")
+    
+    # Re-save the model with protocol 5 so large numpy arrays go out-of-band
+    # into a sidecar file of length-prefixed buffers instead of the pickle
+    # stream. XGBoost keeps its trees in one in-band bytes blob, so the
+    # shipped model has no out-of-band buffers and no sidecar is written;
+    # it only matters for array-backed models such as sklearn forests.
+    print("Re-saving model with pickle protocol 5...")
+    model_path = os.path.join(models_path, 'energy_model.pkl')
+    buffers_path = os.path.join(models_path, 'energy_model.buffers')
+    buffers = []
+    def write_model(path):
+        with open(path, 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL, buffer_callback=buffers.append)
+    def write_buffers(path):
+        with open(path, 'wb') as f:
+            for buffer in buffers:
+                raw = buffer.raw()
+                f.write(struct.pack('<Q', raw.nbytes))
+                f.write(raw)
+    
+    # Write both files in full before either replaces the old copy; the
+    # sidecar goes first, so the pickle is only swapped once its buffers
+    # are in place
+    tmp_model_path = write_to_temp(model_path, write_model)
+    if buffers:
+        os.replace(write_to_temp(buffers_path, write_buffers), buffers_path)
+    os.replace(tmp_model_path, model_path)
+    if not buffers and os.path.exists(buffers_path):
+        os.remove(buffers_path)
+    print(f"Model saved successfully ({len(buffers)} out-of-band buffers)")
+    
+    # Also save an uncompressed joblib copy, which the apps load with
+    # mmap_mode='r' so worker processes share the model's arrays
+    print("Saving model with joblib...")
+    joblib_path = os.path.join(models_path, 'energy_model.joblib')
+    def write_joblib(path):
+        joblib.dump(model, path, compress=0)
+    os.replace(write_to_temp(joblib_path, write_joblib), joblib_path)
+    print("Model saved successfully")
     
-    print("\nAll pickle files are now fixed!")
+    print("\nAll model files are now fixed!")
     print(f"Model RMSE: {config['performance']['rmse']:.2f}")
     print(f"Features: {config['features']}")
     
@@ -3,23 +3,28 @@ Energy Forecasting Flask API
 RESTful API for energy consumption predictions
 """
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, render_template
 from flask_cors import CORS
 import pandas as pd
 import numpy as np
 import sys
 import os
 from datetime import datetime, timedelta
-import json
+import orjson
 import base64
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from io import BytesIO
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
 
 # Add utils to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
-from model_utils import EnergyForecastingModel, create_prediction_chart, create_feature_importance_chart, create_hourly_pattern_chart, create_weekly_pattern_chart
+from model_utils import EnergyForecastingModel, bucket_stats, parse_datetime, new_chart_figure, create_prediction_chart, create_hourly_pattern_chart, create_weekly_pattern_chart, render_feature_importance_png
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -27,40 +32,187 @@ CORS(app)  # Enable CORS for all routes
 # Global model instance
 model = None
 
-def convert_numpy_types(obj):
-    """Convert numpy types to native Python types for JSON serialization"""
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_numpy_types(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(item) for item in obj]
-    else:
-        return obj
+# Resolution of rendered charts; dashboards display them at ~600-1000px wide
+CHART_DPI = 80
+
+# Per-thread figures reused across requests, one per chart type
+_fig_pool = threading.local()
+
+# Worker threads for rendering independent charts concurrently; Agg releases
+# the GIL while rasterizing and compressing PNGs
+_chart_executor = ThreadPoolExecutor(max_workers=4)
+
+# Rendered pattern-analysis PNGs, served by a separate GET. They live on
+# disk, one directory per token, so any worker process on the host can serve
+# them; each set expires CHART_TTL_SECONDS after it was rendered
+CHART_STORE_DIR = os.environ.get(
+    'CHART_STORE_DIR', os.path.join(tempfile.gettempdir(), 'energy_forecasting_charts')
+)
+CHART_TTL_SECONDS = int(os.environ.get('CHART_TTL_SECONDS', 600))
+PATTERN_CHART_NAMES = ('hourly_pattern', 'weekly_pattern', 'time_series')
+
+# orjson serializes numpy scalars/arrays natively, so payloads need no pre-pass
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+def _json(obj, status=200):
+    """Serialize obj with orjson into a JSON response"""
+    return Response(orjson.dumps(obj, option=JSON_OPTIONS), status=status, mimetype='application/json')
 
 def init_model():
     """Initialize the forecasting model"""
     global model
     try:
         model = EnergyForecastingModel()
+        cache_static_responses()
         print("✅ Model loaded successfully!")
         return True
     except Exception as e:
         print(f"❌ Error loading model: {e}")
         return False
 
-def fig_to_base64(fig):
-    """Convert matplotlib figure to base64 string"""
+class PredictionBatcher:
+    """Coalesce concurrent single-datetime predictions into one model call.
+    
+    Requests are queued; a worker thread drains up to max_batch_size of them,
+    waiting at most max_wait seconds for more to arrive, and hands the batch
+    to model.predict_datetimes.
+    """
+    
+    def __init__(self, max_batch_size=32, max_wait=0.005):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+    
+    def predict(self, timestamp, timeout=30):
+        """Queue one datetime and block until its prediction is ready"""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((timestamp, future))
+        return future.result(timeout=timeout)
+    
+    def _ensure_worker(self):
+        # Start lazily so the thread lives in the serving process rather than
+        # in a preloading gunicorn master (threads don't survive fork)
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='prediction-batcher', daemon=True)
+                self._worker.start()
+    
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = model.predict_datetimes([timestamp for timestamp, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+
+_prediction_batcher = PredictionBatcher()
+
+def fig_to_png(fig):
+    """Render matplotlib figure to PNG bytes"""
+    # Chart factories already apply tight_layout, so render once at a
+    # dashboard-sized DPI straight through the Agg canvas
     buffer = BytesIO()
-    fig.savefig(buffer, format='png', bbox_inches='tight', dpi=150)
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    plt.close(fig)
-    return image_base64
+    fig.set_dpi(CHART_DPI)
+    fig.canvas.print_png(buffer)
+    return buffer.getvalue()
+
+def pooled_figure(kind):
+    """Return this thread's reusable figure for a chart type"""
+    fig = getattr(_fig_pool, kind, None)
+    if fig is None:
+        fig = new_chart_figure(kind, dpi=CHART_DPI)
+        setattr(_fig_pool, kind, fig)
+    return fig
+
+def render_chart(kind, create_chart, *args, **kwargs):
+    """Draw a chart onto the pooled figure for kind and return PNG bytes"""
+    fig = pooled_figure(kind)
+    try:
+        create_chart(*args, fig=fig, **kwargs)
+        return fig_to_png(fig)
+    finally:
+        fig.clear()
+
+def png_to_base64(png):
+    """Convert PNG bytes to base64 string"""
+    return base64.b64encode(png).decode('utf-8')
+
+def _png_response(png):
+    """Return PNG bytes as a raw image/png response"""
+    return Response(png, mimetype='image/png')
+
+def _prune_chart_store(now):
+    """Remove chart sets older than CHART_TTL_SECONDS"""
+    for entry in os.scandir(CHART_STORE_DIR):
+        try:
+            expired = now - entry.stat().st_mtime > CHART_TTL_SECONDS
+        except FileNotFoundError:  # pruned concurrently by another worker
+            continue
+        if expired:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+def store_charts(charts):
+    """Keep rendered PNGs for later GETs and return the token addressing them"""
+    os.makedirs(CHART_STORE_DIR, exist_ok=True)
+    _prune_chart_store(time.time())
+    
+    # Write the set into a private directory, then rename it into place so
+    # readers never see a partly written set
+    token = uuid.uuid4().hex
+    tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=CHART_STORE_DIR)
+    for name, png in charts.items():
+        with open(os.path.join(tmp_dir, f'{name}.png'), 'wb') as f:
+            f.write(png)
+    os.replace(tmp_dir, os.path.join(CHART_STORE_DIR, token))
+    return token
+
+def load_stored_chart(token, name):
+    """PNG bytes stored under token, or None if unknown or expired"""
+    if not re.fullmatch(r'[0-9a-f]{32}', token) or name not in PATTERN_CHART_NAMES:
+        return None
+    path = os.path.join(CHART_STORE_DIR, token, f'{name}.png')
+    try:
+        if time.time() - os.path.getmtime(path) > CHART_TTL_SECONDS:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def cache_static_responses():
+    """Pre-serialize responses that depend only on the loaded model"""
+    feature_importance = model.get_feature_importance()
+    
+    app.config['MODEL_INFO_JSON'] = orjson.dumps({
+        'model_info': model.get_model_info(),
+        'feature_importance': feature_importance
+    }, option=JSON_OPTIONS)
+    
+    app.config['FEATURE_IMPORTANCE_PNG'] = render_feature_importance_png(model)
+
+def cached_json_response(key):
+    """Return a pre-serialized JSON body stored in app.config"""
+    return Response(app.config[key], mimetype='application/json')
 
 @app.route('/')
 def home():
@@ -75,7 +227,7 @@ def api_docs():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return _json({
         'status': 'healthy',
         'model_loaded': model is not None,
         'timestamp': datetime.now().isoformat()
@@ -85,56 +237,52 @@ def health_check():
 def model_info():
     """Get model information"""
     if model is None:
-        return jsonify({'error': 'Model not loaded'}), 500
+        return _json({'error': 'Model not loaded'}, 500)
     
     try:
-        info = model.get_model_info()
-        feature_importance = model.get_feature_importance()
-        
-        return jsonify({
-            'model_info': info,
-            'feature_importance': feature_importance
-        })
+        return cached_json_response('MODEL_INFO_JSON')
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json({'error': str(e)}, 500)
 
 @app.route('/api/predict/single', methods=['POST'])
 def predict_single():
     """Predict energy consumption for a single datetime"""
     if model is None:
-        return jsonify({'error': 'Model not loaded'}), 500
+        return _json({'error': 'Model not loaded'}, 500)
     
     try:
         data = request.json
         datetime_str = data.get('datetime')
         
         if not datetime_str:
-            return jsonify({'error': 'datetime parameter is required'}), 400
+            return _json({'error': 'datetime parameter is required'}, 400)
         
-        # Validate datetime format
+        # Parse once; the model reuses the Timestamp instead of re-parsing
         try:
-            datetime.fromisoformat(datetime_str.replace('Z', '+00:00'))
-        except ValueError:
-            return jsonify({'error': 'Invalid datetime format. Use ISO format: YYYY-MM-DDTHH:MM:SS'}), 400
+            timestamp = parse_datetime(datetime_str) if isinstance(datetime_str, str) else pd.NaT
+        except (ValueError, TypeError):
+            timestamp = pd.NaT
+        if timestamp is pd.NaT:
+            return _json({'error': 'Invalid datetime format. Use ISO format: YYYY-MM-DDTHH:MM:SS'}, 400)
         
-        result = model.predict_single_datetime(datetime_str)
+        result = _prediction_batcher.predict(timestamp)
         
         if result:
-            return jsonify({
+            return _json({
                 'success': True,
-                'prediction': convert_numpy_types(result)
+                'prediction': result
             })
         else:
-            return jsonify({'error': 'Prediction failed'}), 500
+            return _json({'error': 'Prediction failed'}, 500)
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json({'error': str(e)}, 500)
 
 @app.route('/api/predict/range', methods=['POST'])
 def predict_range():
     """Predict energy consumption for a date range"""
     if model is None:
-        return jsonify({'error': 'Model not loaded'}), 500
+        return _json({'error': 'Model not loaded'}, 500)
     
     try:
         data = request.json
@@ -143,19 +291,23 @@ def predict_range():
         frequency = data.get('frequency', 'H')
         
         if not start_date or not end_date:
-            return jsonify({'error': 'start_date and end_date parameters are required'}), 400
+            return _json({'error': 'start_date and end_date parameters are required'}, 400)
         
-        result_df = model.predict_date_range(start_date, end_date, freq=frequency)
+        result_df = model.predict_date_range(start_date, end_date, freq=frequency, include_features=True)
         
         if result_df is not None and not result_df.empty:
-            # Convert to JSON-friendly format
-            predictions = []
-            for idx, row in result_df.iterrows():
-                predictions.append({
-                    'datetime': idx.isoformat(),
-                    'prediction': float(row['prediction']),
-                    'features': {col: float(row[col]) for col in model.config['features'] if col in row}
-                })
+            # Convert to JSON-friendly format from one columnar slab
+            features = [col for col in model.config['features'] if col in result_df.columns]
+            rows = result_df[['prediction'] + features].to_numpy(dtype=np.float64).tolist()
+            stamps = result_df.index.strftime('%Y-%m-%dT%H:%M:%S').tolist()
+            predictions = [
+                {
+                    'datetime': stamp,
+                    'prediction': row[0],
+                    'features': dict(zip(features, row[1:]))
+                }
+                for stamp, row in zip(stamps, rows)
+            ]
             
             # Calculate summary statistics
             summary = {
@@ -166,22 +318,22 @@ def predict_range():
                 'std': float(result_df['prediction'].std())
             }
             
-            return jsonify({
+            return _json({
                 'success': True,
-                'predictions': convert_numpy_types(predictions),
-                'summary': convert_numpy_types(summary)
+                'predictions': predictions,
+                'summary': summary
             })
         else:
-            return jsonify({'error': 'Prediction failed'}), 500
+            return _json({'error': 'Prediction failed'}, 500)
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json({'error': str(e)}, 500)
 
 @app.route('/api/predict/chart', methods=['POST'])
 def predict_with_chart():
-    """Predict and return chart as base64 image"""
+    """Predict and return chart as a PNG image"""
     if model is None:
-        return jsonify({'error': 'Model not loaded'}), 500
+        return _json({'error': 'Model not loaded'}, 500)
     
     try:
         data = request.json
@@ -191,63 +343,48 @@ def predict_with_chart():
         chart_type = data.get('chart_type', 'prediction')
         
         if not start_date or not end_date:
-            return jsonify({'error': 'start_date and end_date parameters are required'}), 400
+            return _json({'error': 'start_date and end_date parameters are required'}, 400)
         
         result_df = model.predict_date_range(start_date, end_date, freq=frequency)
         
         if result_df is not None and not result_df.empty:
             # Create chart based on type
             if chart_type == 'prediction':
-                fig = create_prediction_chart(
-                    result_df, 
+                png = render_chart(
+                    'prediction', create_prediction_chart, result_df,
                     title=f"Energy Consumption Prediction ({start_date} to {end_date})"
                 )
             elif chart_type == 'hourly':
-                fig = create_hourly_pattern_chart(result_df)
+                png = render_chart('hourly', create_hourly_pattern_chart, result_df)
             elif chart_type == 'weekly':
-                fig = create_weekly_pattern_chart(result_df)
+                png = render_chart('weekly', create_weekly_pattern_chart, result_df)
             else:
-                return jsonify({'error': 'Invalid chart_type. Use: prediction, hourly, or weekly'}), 400
+                return _json({'error': 'Invalid chart_type. Use: prediction, hourly, or weekly'}, 400)
             
-            # Convert to base64
-            chart_base64 = fig_to_base64(fig)
-            
-            return jsonify({
-                'success': True,
-                'chart': chart_base64,
-                'chart_type': chart_type
-            })
+            return _png_response(png)
         else:
-            return jsonify({'error': 'Prediction failed'}), 500
+            return _json({'error': 'Prediction failed'}, 500)
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json({'error': str(e)}, 500)
 
 @app.route('/api/analysis/feature-importance', methods=['GET'])
 def feature_importance():
     """Get feature importance chart"""
     if model is None:
-        return jsonify({'error': 'Model not loaded'}), 500
+        return _json({'error': 'Model not loaded'}, 500)
     
     try:
-        feature_importance = model.get_feature_importance()
-        fig = create_feature_importance_chart(feature_importance)
-        chart_base64 = fig_to_base64(fig)
-        
-        return jsonify({
-            'success': True,
-            'chart': chart_base64,
-            'feature_importance': convert_numpy_types(feature_importance)
-        })
+        return Response(app.config['FEATURE_IMPORTANCE_PNG'], mimetype='image/png')
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json({'error': str(e)}, 500)
 
 @app.route('/api/analysis/patterns', methods=['POST'])
 def analyze_patterns():
     """Analyze energy consumption patterns"""
     if model is None:
-        return jsonify({'error': 'Model not loaded'}), 500
+        return _json({'error': 'Model not loaded'}, 500)
     
     try:
         data = request.json
@@ -255,29 +392,38 @@ def analyze_patterns():
         end_date = data.get('end_date')
         
         if not start_date or not end_date:
-            return jsonify({'error': 'start_date and end_date parameters are required'}), 400
+            return _json({'error': 'start_date and end_date parameters are required'}, 400)
         
         # Generate predictions for analysis
         result_df = model.predict_date_range(start_date, end_date, freq='H')
         
         if result_df is not None and not result_df.empty:
-            # Create charts
-            hourly_fig = create_hourly_pattern_chart(result_df)
-            weekly_fig = create_weekly_pattern_chart(result_df)
-            prediction_fig = create_prediction_chart(result_df, title="Energy Consumption Analysis")
-            
-            # Convert to base64
+            # Render charts to PNG concurrently and hand back URLs the client
+            # can fetch in parallel
+            futures = {
+                'hourly_pattern': _chart_executor.submit(
+                    render_chart, 'hourly', create_hourly_pattern_chart, result_df
+                ),
+                'weekly_pattern': _chart_executor.submit(
+                    render_chart, 'weekly', create_weekly_pattern_chart, result_df
+                ),
+                'time_series': _chart_executor.submit(
+                    render_chart, 'prediction', create_prediction_chart, result_df,
+                    title="Energy Consumption Analysis"
+                )
+            }
+            token = store_charts({name: future.result() for name, future in futures.items()})
             charts = {
-                'hourly_pattern': fig_to_base64(hourly_fig),
-                'weekly_pattern': fig_to_base64(weekly_fig),
-                'time_series': fig_to_base64(prediction_fig)
+                name: f'/api/analysis/patterns/{token}/{name}.png'
+                for name in PATTERN_CHART_NAMES
             }
             
             # Calculate pattern statistics
-            hourly_stats = result_df.groupby(result_df.index.hour)['prediction'].agg(['mean', 'std']).to_dict()
-            weekly_stats = result_df.groupby(result_df.index.dayofweek)['prediction'].agg(['mean', 'std']).to_dict()
+            predictions = result_df['prediction'].to_numpy()
+            hourly_stats = bucket_stats(result_df.index.hour.to_numpy(), predictions, minlength=24)
+            weekly_stats = bucket_stats(result_df.index.dayofweek.to_numpy(), predictions, minlength=7)
             
-            return jsonify({
+            return _json({
                 'success': True,
                 'charts': charts,
                 'statistics': {
@@ -292,16 +438,26 @@ def analyze_patterns():
                 }
             })
         else:
-            return jsonify({'error': 'Analysis failed'}), 500
+            return _json({'error': 'Analysis failed'}, 500)
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json({'error': str(e)}, 500)
+
+@app.route('/api/analysis/patterns/<token>/<name>.png', methods=['GET'])
+def pattern_chart(token, name):
+    """Serve a chart rendered by /api/analysis/patterns"""
+    png = load_stored_chart(token, name)
+    
+    if png is None:
+        return _json({'error': 'Chart not found or expired'}, 404)
+    
+    return Response(png, mimetype='image/png')
 
 @app.route('/api/analysis', methods=['POST'])
 def analysis():
     """Generate analysis for a date range - simplified version for dashboard"""
     if model is None:
-        return jsonify({'error': 'Model not loaded'}), 500
+        return _json({'error': 'Model not loaded'}, 500)
     
     try:
         data = request.json
@@ -309,7 +465,7 @@ def analysis():
         end_date = data.get('end_date')
         
         if not start_date or not end_date:
-            return jsonify({'error': 'start_date and end_date parameters are required'}), 400
+            return _json({'error': 'start_date and end_date parameters are required'}, 400)
         
         # Use the existing patterns endpoint functionality
         result_df = model.predict_date_range(start_date, end_date, freq='H')
@@ -319,34 +475,44 @@ def analysis():
             
             # Generate hourly pattern chart
             try:
-                hourly_fig = create_hourly_pattern_chart(result_df)
-                if hourly_fig:
-                    response_data['hourly_pattern_chart'] = fig_to_base64(hourly_fig)
+                hourly_png = render_chart('hourly', create_hourly_pattern_chart, result_df)
+                response_data['hourly_pattern_chart'] = png_to_base64(hourly_png)
             except Exception as e:
                 print(f"Error creating hourly pattern chart: {e}")
             
             # Generate weekly pattern chart  
             try:
-                weekly_fig = create_weekly_pattern_chart(result_df)
-                if weekly_fig:
-                    response_data['weekly_pattern_chart'] = fig_to_base64(weekly_fig)
+                weekly_png = render_chart('weekly', create_weekly_pattern_chart, result_df)
+                response_data['weekly_pattern_chart'] = png_to_base64(weekly_png)
             except Exception as e:
                 print(f"Error creating weekly pattern chart: {e}")
             
-            return jsonify(response_data)
+            return _json(response_data)
         else:
-            return jsonify({'error': 'Analysis failed'}), 500
+            return _json({'error': 'Analysis failed'}, 500)
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _json({'error': str(e)}, 500)
+
+# Error bodies never change, so serialize them once. A fresh Response is still
+# built per hit because after_request hooks (CORS) mutate response headers.
+_NOT_FOUND_BODY = orjson.dumps({'error': 'Endpoint not found'})
+_INTERNAL_ERROR_BODY = orjson.dumps({'error': 'Internal server error'})
 
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({'error': 'Endpoint not found'}), 404
+    return Response(_NOT_FOUND_BODY, status=404, mimetype='application/json')
 
 @app.errorhandler(500)
 def internal_error(error):
-    return jsonify({'error': 'Internal server error'}), 500
+    return Response(_INTERNAL_ERROR_BODY, status=500, mimetype='application/json')
+
+# When imported by a WSGI server (e.g. gunicorn with preload_app), load the
+# model up front so the master loads it once and forked workers share it.
+# Only load it here: predicting in the master would start numba's OpenMP
+# threads before the fork, and every forked worker would then abort.
+if __name__ != '__main__':
+    init_model()
 
 if __name__ == '__main__':
     print("Starting Energy Forecasting API...")
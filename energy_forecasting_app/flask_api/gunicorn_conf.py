@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration for the Energy Forecasting Flask API
+Usage (from flask_api/): gunicorn -c gunicorn_conf.py app:app
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+
+# Import the app (and load the model) once in the master before forking, so
+# workers share the model's memory pages copy-on-write instead of each
+# unpickling their own copy on first request. The master must never run a
+# prediction: numba's OpenMP threads do not survive fork, so any warm-up
+# belongs in post_worker_init below, which runs in each worker after it
+# has been forked.
+preload_app = True
+
+# Several workers are safe: the pattern-chart PNGs behind the URLs from
+# /api/analysis/patterns are stored on disk (CHART_STORE_DIR), so whichever
+# worker receives the follow-up GET can serve them
+workers = int(os.environ.get('GUNICORN_WORKERS', max(2, multiprocessing.cpu_count() // 2)))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Chart rendering over long ranges can take a while
+timeout = 120
+
+def post_worker_init(worker):
+    """Compile and start the numba feature kernel in each new worker.
+    
+    Runs on the worker's main thread after the fork, so the first request
+    does not pay for it and the master stays free of OpenMP threads.
+    """
+    import pandas as pd
+    from model_utils import KERNEL_FEATURE_CODES, time_feature_matrix
+    
+    time_feature_matrix(pd.date_range('2024-01-01', periods=2, freq='h'), list(KERNEL_FEATURE_CODES))
@@ -4,17 +4,17 @@ Interactive web app for energy consumption forecasting
 """
 
 import streamlit as st
+import altair as alt
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime, timedelta
+import io
 import sys
 import os
 
 # Add utils to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'utils'))
-from model_utils import EnergyForecastingModel, create_prediction_chart, create_feature_importance_chart, create_hourly_pattern_chart, create_weekly_pattern_chart
+from model_utils import DAY_NAMES, RANGE_CACHE_SIZE, EnergyForecastingModel, hourly_pattern, weekly_pattern
 
 # Page configuration
 st.set_page_config(
@@ -57,6 +57,27 @@ def load_model():
         st.error(f"Error loading model: {e}")
         return None
 
+@st.cache_data(max_entries=RANGE_CACHE_SIZE)
+def predictions_to_csv(start_date, end_date, freq, _df):
+    """Encode the predictions for a range as CSV bytes.
+    
+    Cached per (start_date, end_date, freq), the same key as the model's
+    range cache; the leading underscore keeps Streamlit from hashing the
+    frame itself. Only the most recent RANGE_CACHE_SIZE ranges are kept.
+    """
+    buffer = io.BytesIO()
+    _df.to_csv(buffer)
+    return buffer.getvalue()
+
+def bar_chart(series, x_title, y_title, sort=None, horizontal=False):
+    """Altair bar chart of a Series; Vega-Lite renders it in the browser"""
+    data = series.rename_axis('x').reset_index(name='y')
+    x = alt.X('x:N', title=x_title, sort=sort)
+    y = alt.Y('y:Q', title=y_title)
+    if horizontal:
+        x, y = alt.X('y:Q', title=y_title), alt.Y('x:N', title=x_title, sort=sort)
+    return alt.Chart(data).mark_bar().encode(x=x, y=y)
+
 def main():
     # Header
     st.markdown('<h1 class="main-header">Energy Forecasting Dashboard</h1>', unsafe_allow_html=True)
@@ -158,12 +179,9 @@ def main():
                     if result_df is not None and not result_df.empty:
                         st.success(f"Generated {len(result_df)} predictions!")
                         
-                        # Create and display chart
-                        fig = create_prediction_chart(
-                            result_df, 
-                            title=f"Energy Consumption Prediction ({start_date} to {end_date})"
-                        )
-                        st.pyplot(fig)
+                        # Display chart
+                        st.subheader(f"Energy Consumption Prediction ({start_date} to {end_date})")
+                        st.line_chart(result_df['prediction'])
                         
                         # Summary statistics
                         col1, col2, col3, col4 = st.columns(4)
@@ -177,10 +195,9 @@ def main():
                             st.metric("Std Dev", f"{result_df['prediction'].std():.2f} MW")
                         
                         # Download predictions
-                        csv = result_df[['prediction']].to_csv()
                         st.download_button(
                             label="Download Predictions as CSV",
-                            data=csv,
+                            data=predictions_to_csv(start_date, end_date, frequency, result_df[['prediction']]),
                             file_name=f'energy_predictions_{start_date}_to_{end_date}.csv',
                             mime='text/csv'
                         )
@@ -217,21 +234,19 @@ def main():
                 if analysis_df is not None and not analysis_df.empty:
                     # Hourly pattern
                     st.subheader("Hourly Usage Pattern")
-                    hourly_fig = create_hourly_pattern_chart(analysis_df)
-                    st.pyplot(hourly_fig)
+                    st.line_chart(hourly_pattern(analysis_df))
                     
                     # Weekly pattern
                     st.subheader("Weekly Usage Pattern")
-                    weekly_fig = create_weekly_pattern_chart(analysis_df)
-                    st.pyplot(weekly_fig)
+                    st.altair_chart(
+                        bar_chart(weekly_pattern(analysis_df), 'Day of Week',
+                                  'Average Energy Consumption (MW)', sort=DAY_NAMES),
+                        use_container_width=True
+                    )
                     
                     # Time series
                     st.subheader("Time Series View")
-                    time_fig = create_prediction_chart(
-                        analysis_df, 
-                        title=f"Energy Consumption Pattern ({analysis_start} to {analysis_end})"
-                    )
-                    st.pyplot(time_fig)
+                    st.line_chart(analysis_df['prediction'])
                 else:
                     st.error("Failed to generate analysis")
     
@@ -242,8 +257,11 @@ def main():
         feature_importance = model.get_feature_importance()
         
         # Create chart
-        importance_fig = create_feature_importance_chart(feature_importance)
-        st.pyplot(importance_fig)
+        st.altair_chart(
+            bar_chart(pd.Series(feature_importance, dtype=float), 'Feature', 'Importance',
+                      sort='-x', horizontal=True),
+            use_container_width=True
+        )
         
         # Feature importance table
         st.subheader("Feature Importance Values")
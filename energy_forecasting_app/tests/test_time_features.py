@@ -0,0 +1,75 @@
+"""
+Check the integer-arithmetic time features against the pandas accessors
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'utils'))
+
+import model_utils
+
+FEATURES = ['hour', 'dayofweek', 'quarter', 'month', 'year',
+            'dayofyear', 'dayofmonth', 'weekofyear']
+
+RANGES = [
+    # Every 7 hours walks through each hour of the day across both
+    # century boundaries and every ISO week 53
+    pd.date_range('1890-01-01', '2110-12-31', freq='7h'),
+    pd.date_range('1678-01-01', '2261-12-31', freq='D'),
+    pd.date_range('2023-03-26', '2023-10-29 12:00', freq='h', tz='Europe/London'),
+]
+
+
+def expected_features(idx):
+    """Time features of idx taken from the pandas accessors"""
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    return {
+        'hour': idx.hour,
+        'dayofweek': idx.dayofweek,
+        'quarter': idx.quarter,
+        'month': idx.month,
+        'year': idx.year,
+        'dayofyear': idx.dayofyear,
+        'dayofmonth': idx.day,
+        'weekofyear': idx.isocalendar().week,
+    }
+
+
+@pytest.fixture(params=['numba', 'numpy'])
+def kernel(request, monkeypatch):
+    if request.param == 'numba':
+        if model_utils.njit is None:
+            pytest.skip('numba is not installed')
+    else:
+        monkeypatch.setattr(model_utils, 'njit', None)
+    return request.param
+
+
+@pytest.mark.parametrize('idx', RANGES, ids=['7h', 'daily', 'tz'])
+def test_time_fields_match_pandas(idx):
+    fields = model_utils.time_fields(idx)
+    for name, values in expected_features(idx).items():
+        np.testing.assert_array_equal(fields[name], np.asarray(values), err_msg=name)
+
+
+@pytest.mark.parametrize('idx', RANGES, ids=['7h', 'daily', 'tz'])
+def test_time_feature_matrix_matches_pandas(idx, kernel):
+    X = model_utils.time_feature_matrix(idx, FEATURES)
+    assert X.dtype == model_utils.FEATURE_DTYPE
+    for col, (name, values) in enumerate(expected_features(idx).items()):
+        np.testing.assert_array_equal(X[:, col], np.asarray(values, dtype=np.float64), err_msg=name)
+
+
+def test_time_feature_matrix_column_order(kernel):
+    idx = pd.date_range('2024-12-29', periods=100, freq='5h')
+    features = ['year', 'weekofyear', 'hour']
+    X = model_utils.time_feature_matrix(idx, features)
+    expected = expected_features(idx)
+    for col, name in enumerate(features):
+        np.testing.assert_array_equal(X[:, col], np.asarray(expected[name], dtype=np.float64), err_msg=name)
@@ -4,42 +4,457 @@ Provides functions for loading models and making predictions
 """
 
 import pickle
+import joblib
+import msgspec
+from joblib import Parallel, delayed
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
+from PIL import Image, ImageDraw
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from functools import lru_cache
+from io import BytesIO
+from typing import Dict, List, Union
+import hashlib
+import mmap
 import os
+import struct
+import sys
+import threading
+
+try:
+    import numba
+    from numba import njit, prange
+except ImportError:  # numba is optional; features fall back to NumPy
+    njit = None
+else:
+    # Kernels also run on worker threads (the Flask batcher and chart pool),
+    # and numba's TBB pool can then hang interpreter exit; prefer OpenMP.
+    # GNU OpenMP is not fork-safe: once a parallel kernel has run, forked
+    # children abort, so a process that forks workers (gunicorn with
+    # preload_app) must not run one before forking. Warm up after the fork
+    # instead, as gunicorn_conf.post_worker_init does.
+    if 'NUMBA_THREADING_LAYER_PRIORITY' not in os.environ:
+        numba.config.THREADING_LAYER_PRIORITY = ['omp', 'tbb', 'workqueue']
+
+try:
+    import tl2cgen
+    import treelite
+except ImportError:  # treelite/tl2cgen are optional; XGBoost predicts instead
+    tl2cgen = None
+
+def iter_buffers_from_file(path):
+    """Yield the out-of-band pickle buffers stored in a sidecar file.
+    
+    Only array-backed models (e.g. sklearn forests) have such buffers; the
+    shipped XGBoost model pickles its trees in-band, so fix_pickle_files.py
+    writes no sidecar for it. The file is memory-mapped copy-on-write and
+    each buffer is a view into the mapping, so arrays are not copied while
+    unpickling yet stay writable.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    
+    view = memoryview(mapped)
+    offset = 0
+    while offset < size:
+        (nbytes,) = struct.unpack_from('<Q', mapped, offset)
+        offset += 8
+        yield view[offset:offset + nbytes]
+        offset += nbytes
+
+# Below this many rows, splitting a prediction across threads costs more
+# than it saves
+PARALLEL_PREDICT_MIN_ROWS = 50_000
+
+# Dtype of every feature matrix. The fields are small integers, but XGBoost
+# predicts in float32 natively: int32/int16 matrices are converted inside
+# the booster and measured slower, so float32 is also the narrowest input
+FEATURE_DTYPE = np.float32
+
+# Dtype of every prediction array; float32 keeps display precision at half
+# the bytes through plotting and serialization
+PREDICTION_DTYPE = np.float32
+
+# Largest datetime batch whose features are built in a reused per-thread
+# buffer; bigger batches get a fresh matrix rather than growing the buffer
+SCRATCH_MAX_ROWS = 4096
+
+# How many predict_date_range results each model keeps
+RANGE_CACHE_SIZE = 32
+
+# Ranges longer than this (about 11 years hourly) are never cached, so a few
+# huge client-chosen ranges can't pin hundreds of MB per worker
+MAX_CACHED_RANGE_ROWS = 100_000
+
+# Lengths of the ISO strings the stdlib parser handles: YYYY-MM-DD and
+# YYYY-MM-DDTHH:MM:SS
+ISO_DATETIME_LENGTHS = (10, 19)
+
+def parse_datetime(value):
+    """Parse a datetime input into a pd.Timestamp.
+    
+    Timestamps are returned as-is, integers are read as epoch seconds and
+    plain ISO strings go through Timestamp.fromisoformat; anything else falls
+    back to the generic pd.to_datetime parser.
+    """
+    if isinstance(value, pd.Timestamp):
+        return value
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return pd.Timestamp(value, unit='s')
+    if isinstance(value, str) and len(value) in ISO_DATETIME_LENGTHS:
+        try:
+            return pd.Timestamp.fromisoformat(value)
+        except ValueError:
+            pass
+    return pd.to_datetime(value)
+
+def _days_from_civil(year, month, day):
+    """Days since 1970-01-01 of a proleptic Gregorian date (Howard Hinnant)"""
+    year = year - (month <= 2)
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+def _iso_weeks_in_year(year):
+    """Number of ISO weeks (52 or 53) in each year"""
+    def dec31_weekday(y):
+        # 4 when December 31st of year y is a Thursday
+        return (y + y // 4 - y // 100 + y // 400) % 7
+    return 52 + ((dec31_weekday(year) == 4) | (dec31_weekday(year - 1) == 3))
+
+def time_fields(idx, features=None):
+    """Time features of a DatetimeIndex, computed with integer arithmetic.
+    
+    All fields come from one pass over the epoch seconds instead of one
+    pandas accessor (and one traversal of the index) per field. Times are
+    wall-clock, so any timezone is dropped first. features limits the
+    result to the named fields; by default all of them are returned.
+    """
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    seconds = idx.values.astype('datetime64[s]').astype(np.int64)
+    days = seconds // 86400
+    
+    # Civil date from day count (Howard Hinnant's civil_from_days); floor
+    # division keeps it correct before 1970 too
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    day = doy - (153 * mp + 2) // 5 + 1
+    month = np.where(mp < 10, mp + 3, mp - 9)
+    year = yoe + era * 400 + (month <= 2)
+    
+    dayofweek = (days + 3) % 7  # 1970-01-01 was a Thursday
+    dayofyear = days - _days_from_civil(year, 1, 1) + 1
+    
+    # ISO week from the ordinal day and ISO weekday (Monday=1); days before
+    # week 1 belong to the last week of the previous year, and days after
+    # the last week to week 1 of the next
+    week = (dayofyear - dayofweek + 9) // 7
+    week = np.where(
+        week < 1, _iso_weeks_in_year(year - 1),
+        np.where(week > _iso_weeks_in_year(year), 1, week)
+    )
+    
+    fields = {
+        'hour': (seconds % 86400) // 3600,
+        'dayofweek': dayofweek,
+        'quarter': (month - 1) // 3 + 1,
+        'month': month,
+        'year': year,
+        'dayofyear': dayofyear,
+        'dayofmonth': day,
+        'weekofyear': week,
+    }
+    if features is not None:
+        fields = {name: fields[name] for name in features}
+    return fields
+
+def time_features_frame(idx, features=None):
+    """Features-only DataFrame for a DatetimeIndex"""
+    return pd.DataFrame(time_fields(idx, features), index=idx)
+
+def create_time_features(df):
+    """Create time-based features from datetime index"""
+    features = time_features_frame(df.index)
+    
+    # Attach the feature columns without copying the existing ones, which
+    # assign() would do; recomputed features replace any stale columns
+    stale = df.columns.intersection(features.columns)
+    if len(stale):
+        df = df.drop(columns=stale)
+    return pd.concat([df, features], axis=1, copy=False)
+
+# Column codes understood by the compiled feature kernel
+KERNEL_FEATURE_CODES = {
+    'hour': 0,
+    'dayofweek': 1,
+    'quarter': 2,
+    'month': 3,
+    'year': 4,
+    'dayofyear': 5,
+    'dayofmonth': 6,
+    'weekofyear': 7,
+}
+
+if njit is not None:
+    @njit(cache=True)
+    def _iso_weeks_in_year_scalar(year):
+        """Number of ISO weeks (52 or 53) in a year, for the kernel"""
+        p = (year + year // 4 - year // 100 + year // 400) % 7
+        y = year - 1
+        p_prev = (y + y // 4 - y // 100 + y // 400) % 7
+        return 53 if p == 4 or p_prev == 3 else 52
+    
+    @njit(parallel=True, cache=True)
+    def _build_features(epoch_seconds, codes, out):
+        """Fill out[i, j] with feature codes[j] of epoch_seconds[i].
+        
+        Same arithmetic as time_fields, one row per iteration so each
+        thread fills a contiguous block of rows. Columns with a negative
+        code are left untouched.
+        """
+        for i in prange(epoch_seconds.shape[0]):
+            s = epoch_seconds[i]
+            days = s // 86400
+            
+            z = days + 719468
+            era = z // 146097
+            doe = z - era * 146097
+            yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+            doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+            mp = (5 * doy + 2) // 153
+            day = doy - (153 * mp + 2) // 5 + 1
+            month = mp + 3 if mp < 10 else mp - 9
+            year = yoe + era * 400 + (1 if month <= 2 else 0)
+            
+            # Day count of January 1st, for dayofyear
+            y = year - 1
+            jan_era = y // 400
+            jan_yoe = y - jan_era * 400
+            jan1 = jan_era * 146097 + jan_yoe * 365 + jan_yoe // 4 - jan_yoe // 100 + 306 - 719468
+            dayofweek = (days + 3) % 7
+            dayofyear = days - jan1 + 1
+            
+            # ISO week, as in time_fields
+            week = (dayofyear - dayofweek + 9) // 7
+            if week < 1:
+                week = _iso_weeks_in_year_scalar(year - 1)
+            elif week > _iso_weeks_in_year_scalar(year):
+                week = 1
+            
+            for j in range(codes.shape[0]):
+                code = codes[j]
+                if code == 0:
+                    out[i, j] = (s % 86400) // 3600
+                elif code == 1:
+                    out[i, j] = dayofweek
+                elif code == 2:
+                    out[i, j] = (month - 1) // 3 + 1
+                elif code == 3:
+                    out[i, j] = month
+                elif code == 4:
+                    out[i, j] = year
+                elif code == 5:
+                    out[i, j] = dayofyear
+                elif code == 6:
+                    out[i, j] = day
+                elif code == 7:
+                    out[i, j] = week
+
+def time_feature_matrix(idx, features, out=None):
+    """Float32 feature matrix for a DatetimeIndex, columns in the given order.
+    
+    Only the requested features are kept. When numba is installed the
+    matrix is filled by the compiled _build_features kernel in a single
+    parallel pass. The matrix is written into out, of shape
+    (len(idx), len(features)), when one is given.
+    """
+    X = np.empty((len(idx), len(features)), dtype=FEATURE_DTYPE) if out is None else out
+    if njit is None:
+        for col, values in enumerate(time_fields(idx, features).values()):
+            X[:, col] = values
+        return X
+    
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    codes = np.array([KERNEL_FEATURE_CODES.get(name, -1) for name in features], dtype=np.int64)
+    _build_features(idx.values.astype('datetime64[s]').astype(np.int64), codes, X)
+    
+    # Names the kernel doesn't know are left to time_fields, which raises
+    # for them like the NumPy path
+    others = [name for name in features if name not in KERNEL_FEATURE_CODES]
+    if others:
+        for name, values in time_fields(idx, others).items():
+            X[:, features.index(name)] = values
+    return X
+
+def _estimated_range_rows(start_date, end_date, freq):
+    """Upper estimate of the rows in a date range, without building it"""
+    try:
+        step = pd.tseries.frequencies.to_offset(freq).nanos
+    except ValueError:
+        # Calendar offsets (e.g. month ends) have no fixed length
+        return len(pd.date_range(start=start_date, end=end_date, freq=freq))
+    span = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).value
+    return max(span // step + 1, 0)
+
+def _build_range_feature_matrix(start_date, end_date, freq, features):
+    """Date range index and its read-only float32 feature matrix"""
+    index = pd.date_range(start=start_date, end=end_date, freq=freq)
+    X = time_feature_matrix(index, features)
+    X.setflags(write=False)
+    return index, X
+
+_cached_range_feature_matrix = lru_cache(maxsize=32)(_build_range_feature_matrix)
+
+def _range_feature_matrix(start_date, end_date, freq, features):
+    """Date range index and its float32 feature matrix, memoized.
+    
+    Features depend only on the index, so repeated ranges skip both
+    pd.date_range and feature creation. The cache is keyed on the resolved
+    timestamps, so relative inputs such as 'now' are never replayed and
+    equivalent spellings of a date share one entry. Ranges over
+    MAX_CACHED_RANGE_ROWS rows are built fresh every time. The matrix is
+    read-only because it is shared between callers.
+    """
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    if _estimated_range_rows(start_date, end_date, freq) > MAX_CACHED_RANGE_ROWS:
+        return _build_range_feature_matrix(start_date, end_date, freq, features)
+    return _cached_range_feature_matrix(start_date, end_date, freq, features)
+
+def sort_feature_importance(feature_importance):
+    """(features, importance) arrays of a feature importance dict, least important first"""
+    items = sorted(feature_importance.items(), key=lambda item: item[1])
+    return (
+        np.array([feature for feature, _ in items]),
+        np.array([importance for _, importance in items], dtype=np.float32)
+    )
+
+class ModelConfig(msgspec.Struct):
+    """Schema of the model configuration stored in model_config.msgpack"""
+    features: List[str]
+    target: str
+    performance: Dict[str, float]
+    feature_importance: Dict[str, float]
+    created_date: str
+    model_params: Dict[str, Union[int, float, str]] = {}
+
+def _is_fresh(derived_path, source_path):
+    """True if derived_path exists and is at least as new as source_path.
+    
+    fix_pickle_files.py derives faster-loading copies from the pickles the
+    training notebook writes; once the notebook writes a newer pickle, the
+    copy is stale and the pickle must win.
+    """
+    if not os.path.exists(derived_path):
+        return False
+    if not os.path.exists(source_path):
+        return True
+    if os.path.getmtime(derived_path) >= os.path.getmtime(source_path):
+        return True
+    print(f"⚠️ {os.path.basename(source_path)} is newer than {os.path.basename(derived_path)}; "
+          f"loading it instead (re-run fix_pickle_files.py to refresh the copy)")
+    return False
+
+def _load_model_files(models_path):
+    """Load the trained model and its configuration from models_path"""
+    # Load the trained model, preferring the joblib copy written by
+    # fix_pickle_files.py: its numpy arrays are memory-mapped, so
+    # forked workers share the pages instead of each holding a copy. A
+    # pickle retrained since then is newer and wins over the stale copy.
+    joblib_path = os.path.join(models_path, 'energy_model.joblib')
+    pickle_path = os.path.join(models_path, 'energy_model.pkl')
+    if _is_fresh(joblib_path, pickle_path):
+        model = joblib.load(joblib_path, mmap_mode='r')
+    else:
+        # Fall back to the pickle, along with its out-of-band array
+        # buffers if it was saved with pickle protocol 5
+        buffers_path = os.path.join(models_path, 'energy_model.buffers')
+        buffers = iter_buffers_from_file(buffers_path) if os.path.exists(buffers_path) else None
+        with open(pickle_path, 'rb', buffering=1 << 20) as f:
+            model = pickle.load(f, buffers=buffers)
+    
+    # Load model configuration, preferring the msgpack copy written by
+    # fix_pickle_files.py over the legacy pickle unless the notebook has
+    # written a newer pickle since
+    config_path = os.path.join(models_path, 'model_config.msgpack')
+    if _is_fresh(config_path, os.path.join(models_path, 'model_config.pkl')):
+        with open(config_path, 'rb') as f:
+            config = msgspec.msgpack.decode(f.read(), type=ModelConfig)
+        config = msgspec.structs.asdict(config)
+    else:
+        with open(os.path.join(models_path, 'model_config.pkl'), 'rb') as f:
+            config = pickle.load(f)
+    
+    return model, config
+
+# Loaded (model, config) pairs by models path, shared by every instance so
+# the model is deserialized once per process
+_MODEL_CACHE: Dict[str, tuple] = {}
+_MODEL_CACHE_LOCK = threading.Lock()
 
 class EnergyForecastingModel:
     """Class to handle energy forecasting model operations"""
     
-    def __init__(self, models_path=None):
+    def __init__(self, models_path=None, reload=False):
         if models_path is None:
             # Auto-detect models path
             current_dir = os.path.dirname(os.path.abspath(__file__))
             models_path = os.path.join(os.path.dirname(current_dir), "..", "models")
             models_path = os.path.abspath(models_path)
         
-        self.models_path = models_path
+        self.models_path = os.path.abspath(models_path)
         self.model = None
+        self._booster = None
+        self._iteration_range = (0, 0)
+        self._fast_predict = None
         self.create_features_func = None
         self.config = None
-        self.load_model_components()
+        self._feature_names = ()
+        self._fi_sorted = (np.array([]), np.array([], dtype=np.float32))
+        self._range_cache = OrderedDict()
+        self._range_cache_lock = threading.Lock()
+        self._scratch = threading.local()
+        self.load_model_components(reload=reload)
     
-    def load_model_components(self):
-        """Load all model components from pickle files"""
+    def load_model_components(self, reload=False):
+        """Load all model components from pickle files.
+        
+        Models already loaded from the same path by another instance are
+        shared rather than loaded again, unless reload is set.
+        """
         try:
-            # Load the trained model
-            with open(os.path.join(self.models_path, 'energy_model.pkl'), 'rb') as f:
-                self.model = pickle.load(f)
+            with _MODEL_CACHE_LOCK:
+                components = None if reload else _MODEL_CACHE.get(self.models_path)
+                if components is None:
+                    components = _load_model_files(self.models_path)
+                    _MODEL_CACHE[self.models_path] = components
+            self.model, self.config = components
+            self._init_booster()
             
             # Don't load function from pickle, use the one defined in this module
             self.create_features_func = self.create_features_local
             
-            # Load model configuration
-            with open(os.path.join(self.models_path, 'model_config.pkl'), 'rb') as f:
-                self.config = pickle.load(f)
+            # Column order the model expects, fixed for the lifetime of the config
+            self._feature_names = tuple(self.config['features'])
+            
+            # Feature importance never changes for a loaded config, so sort
+            # it once for the charts
+            self._fi_sorted = sort_feature_importance(self.config.get('feature_importance', {}))
+            
+            # Results cached from a previous model are stale
+            with self._range_cache_lock:
+                self._range_cache.clear()
             
             print("✅ All model components loaded successfully!")
             
@@ -47,75 +462,234 @@ class EnergyForecastingModel:
             print(f"❌ Error loading model components: {e}")
             raise
     
+    def _init_booster(self):
+        """Grab the raw XGBoost booster, if any, for direct float32 prediction"""
+        self._booster = None
+        self._iteration_range = (0, 0)
+        self._fast_predict = None
+        if not hasattr(self.model, 'get_booster'):
+            return
+        
+        self._booster = self.model.get_booster()
+        self._booster.set_param({'nthread': os.cpu_count()})
+        
+        # Match XGBRegressor.predict, which stops at the early-stopping round
+        best_iteration = getattr(self.model, 'best_iteration', None)
+        if best_iteration is not None:
+            self._iteration_range = (0, best_iteration + 1)
+        
+        # Compiling takes several seconds on first start and needs write
+        # access to models_path; ENERGY_MODEL_COMPILE=0 turns it off
+        if tl2cgen is not None and os.environ.get('ENERGY_MODEL_COMPILE', '1') != '0':
+            try:
+                self._fast_predict = self._compile_booster()
+            except Exception as e:
+                print(f"⚠️ Compiled predictor unavailable, using XGBoost: {e}")
+    
+    def _compile_booster(self):
+        """Compile the booster's trees to native code with treelite/tl2cgen.
+        
+        The shared library is cached next to the model, named after a hash
+        of the trees, so it is only rebuilt when the model changes. It is
+        built under a per-process temporary name and moved into place, so
+        workers starting together never load a half-written library.
+        """
+        booster = self._booster
+        if self._iteration_range != (0, 0):
+            booster = booster[self._iteration_range[0]:self._iteration_range[1]]
+        
+        digest = hashlib.sha1(booster.save_raw()).hexdigest()[:12]
+        suffix = {'win32': '.dll', 'darwin': '.dylib'}.get(sys.platform, '.so')
+        libpath = os.path.join(self.models_path, f'energy_model-{digest}{suffix}')
+        if not os.path.exists(libpath):
+            toolchain = 'msvc' if sys.platform == 'win32' else 'gcc'
+            tmp_libpath = os.path.join(
+                self.models_path, f'energy_model-{digest}.{os.getpid()}.tmp{suffix}'
+            )
+            try:
+                tl2cgen.export_lib(
+                    treelite.frontend.from_xgboost(booster),
+                    toolchain=toolchain,
+                    libpath=tmp_libpath,
+                    params={'parallel_comp': os.cpu_count()}
+                )
+                os.replace(tmp_libpath, libpath)
+            finally:
+                if os.path.exists(tmp_libpath):
+                    os.remove(tmp_libpath)
+        
+        predictor = tl2cgen.Predictor(libpath, nthread=os.cpu_count())
+        return lambda X: predictor.predict(tl2cgen.DMatrix(X)).reshape(-1)
+    
+    def _predict_chunk(self, X):
+        """Predict one float32 feature matrix as a PREDICTION_DTYPE array"""
+        if self._fast_predict is not None:
+            predictions = self._fast_predict(X)
+        elif self._booster is not None:
+            predictions = self._booster.inplace_predict(X, iteration_range=self._iteration_range)
+        else:
+            predictions = self.model.predict(X)
+        # A no-op for XGBoost, which already predicts float32
+        return predictions.astype(PREDICTION_DTYPE, copy=False)
+    
+    def _predict_matrix(self, X, n_jobs=None):
+        """Predict from a feature matrix in the model's feature order.
+        
+        Features are cast to float32, the dtype XGBoost works in. XGBoost
+        models then skip the sklearn wrapper and its DMatrix construction via
+        Booster.inplace_predict.
+        
+        With n_jobs > 1, large matrices are split into contiguous row chunks
+        predicted in parallel threads; predict releases the GIL, so the
+        chunks run concurrently.
+        """
+        # No copy for matrices built by time_feature_matrix, already FEATURE_DTYPE
+        X = np.asarray(X, dtype=FEATURE_DTYPE)
+        if n_jobs is None or n_jobs == 1 or len(X) < PARALLEL_PREDICT_MIN_ROWS:
+            return self._predict_chunk(X)
+        
+        if n_jobs < 0:
+            n_jobs = os.cpu_count()
+        chunks = np.array_split(X, n_jobs)
+        predictions = Parallel(n_jobs=n_jobs, backend='threading')(
+            delayed(self._predict_chunk)(chunk) for chunk in chunks
+        )
+        return np.concatenate(predictions)
+    
     def create_features_local(self, df):
-        """Create time-based features from datetime index"""
-        df = df.copy()
-        df['hour'] = df.index.hour
-        df['dayofweek'] = df.index.dayofweek
-        df['quarter'] = df.index.quarter
-        df['month'] = df.index.month
-        df['year'] = df.index.year
-        df['dayofyear'] = df.index.dayofyear
-        df['dayofmonth'] = df.index.day
-        df['weekofyear'] = df.index.isocalendar().week
-        return df
+        """Create time-based features from datetime index.
+        
+        Given a bare DatetimeIndex instead of a frame, returns a fresh
+        features-only frame holding just the model's features.
+        """
+        if isinstance(df, pd.DatetimeIndex):
+            return time_features_frame(df, self._feature_names)
+        return create_time_features(df)
     
     def create_features(self, df):
         """Create time-based features from datetime index"""
         return self.create_features_func(df)
     
+    def _features_matrix(self, idx):
+        """Model-ordered float32 feature matrix for a DatetimeIndex.
+        
+        Batches of up to SCRATCH_MAX_ROWS rows are built in a per-thread
+        buffer that is reused across calls, so the result is only valid
+        until the same thread builds its next matrix.
+        """
+        n, k = len(idx), len(self._feature_names)
+        if n > SCRATCH_MAX_ROWS:
+            return time_feature_matrix(idx, self._feature_names)
+        
+        scratch = getattr(self._scratch, 'X', None)
+        if scratch is None or scratch.shape[0] < n or scratch.shape[1] != k:
+            scratch = np.empty((max(n, 32), k), dtype=FEATURE_DTYPE)
+            self._scratch.X = scratch
+        return time_feature_matrix(idx, self._feature_names, out=scratch[:n])
+    
     def predict_single_datetime(self, datetime_str, energy_value=None):
-        """Predict energy consumption for a single datetime"""
+        """Predict energy consumption for a single datetime.
+        
+        Accepts a datetime string, epoch seconds, or an already parsed
+        pd.Timestamp which is used as-is without parsing again.
+        """
         try:
-            # Create datetime index
-            dt = pd.to_datetime(datetime_str)
-            
-            # Create dummy dataframe
-            dummy_data = {'AEP_MW': [energy_value or 0]}
-            df = pd.DataFrame(dummy_data, index=[dt])
-            
-            # Create features
-            df_features = self.create_features(df)
-            
-            # Extract features for prediction
-            X = df_features[self.config['features']]
-            
-            # Make prediction
-            prediction = self.model.predict(X)[0]
-            
-            return {
-                'datetime': datetime_str,
-                'prediction': float(prediction),
-                'features': X.iloc[0].to_dict()
-            }
+            return self.predict_datetimes([datetime_str])[0]
             
         except Exception as e:
             print(f"Error in prediction: {e}")
             return None
     
-    def predict_date_range(self, start_date, end_date, freq='H'):
-        """Predict energy consumption for a date range"""
+    @staticmethod
+    def _datetime_index(datetimes):
+        """DatetimeIndex of wall-clock times for a sequence of datetimes"""
+        timestamps = [parse_datetime(dt) for dt in datetimes]
+        
+        # Features are wall-clock fields, so drop any timezone; this also lets
+        # naive and tz-aware datetimes share a batch
+        return pd.DatetimeIndex([ts.tz_localize(None) if ts.tzinfo else ts for ts in timestamps])
+    
+    def predict_many(self, datetimes):
+        """Predict energy consumption for many datetimes in one model call.
+        
+        Returns an array of predictions aligned with datetimes. The fixed
+        per-call cost of feature building and model.predict dominates for
+        small inputs, so callers should accumulate requests into batches
+        (e.g. 256-4096 rows) instead of predicting one datetime at a time.
+        """
+        return self._predict_matrix(self._features_matrix(self._datetime_index(datetimes)))
+    
+    def predict_datetimes(self, datetimes):
+        """Predict energy consumption for several datetimes with one model call.
+        
+        Like predict_many, but returns one result dict per datetime, shaped
+        like the result of predict_single_datetime. Errors are raised rather
+        than swallowed.
+        """
+        # Create features directly in model column order, skipping the
+        # DataFrame build and df[features] projection; X may be the scratch
+        # buffer, so it is fully read before returning
+        X = self._features_matrix(self._datetime_index(datetimes))
+        
+        # Make predictions
+        predictions = self._predict_matrix(X)
+        
+        return [
+            {
+                'datetime': dt.isoformat() if isinstance(dt, pd.Timestamp) else dt,
+                'prediction': float(prediction),
+                'features': dict(zip(self._feature_names, map(int, row)))
+            }
+            for dt, prediction, row in zip(datetimes, predictions.tolist(), X.tolist())
+        ]
+    
+    def predict_date_range(self, start_date, end_date, freq='H', n_jobs=None, include_features=False):
+        """Predict energy consumption for a date range.
+        
+        The result holds just the float32 prediction column; include_features
+        adds the model's feature columns in front of it. n_jobs sets how many
+        threads share the prediction of long ranges (-1 for one per CPU); by
+        default a single call is made.
+        
+        The most recent results of up to MAX_CACHED_RANGE_ROWS rows are
+        cached, so re-requesting a range costs only a copy of the cached
+        frame.
+        """
         try:
-            # Create date range
-            date_range = pd.date_range(start=start_date, end=end_date, freq=freq)
+            # Resolve the bounds once so both caches share one key, and
+            # relative inputs like 'now' never match an earlier call
+            start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+            key = (start_date, end_date, freq, include_features)
+            with self._range_cache_lock:
+                cached = self._range_cache.get(key)
+                if cached is not None:
+                    self._range_cache.move_to_end(key)
+            if cached is not None:
+                # Callers get their own copy of the data: the model is shared
+                # (e.g. across Streamlit sessions), so writes into a returned
+                # frame must never reach the cached one
+                return cached.copy(deep=True)
             
-            # Create dummy dataframe
-            df = pd.DataFrame({'AEP_MW': [0] * len(date_range)}, index=date_range)
-            
-            # Create features
-            df_features = self.create_features(df)
-            
-            # Extract features for prediction
-            X = df_features[self.config['features']]
+            # Create date range and its (cached) feature matrix; no dummy
+            # frame is built, only the index and the model-ordered matrix
+            date_range, X = _range_feature_matrix(start_date, end_date, freq, self._feature_names)
             
             # Make predictions
-            predictions = self.model.predict(X)
+            predictions = self._predict_matrix(X, n_jobs=n_jobs)
+            
+            # Create result dataframe, wrapping the predictions without a copy
+            result_df = pd.DataFrame({'prediction': predictions}, index=date_range, copy=False)
+            if include_features:
+                features_df = pd.DataFrame(X, index=date_range, columns=list(self._feature_names))
+                result_df = pd.concat([features_df, result_df], axis=1, copy=False)
             
-            # Create result dataframe
-            result_df = df_features.copy()
-            result_df['prediction'] = predictions
+            if len(result_df) <= MAX_CACHED_RANGE_ROWS:
+                with self._range_cache_lock:
+                    self._range_cache[key] = result_df
+                    while len(self._range_cache) > RANGE_CACHE_SIZE:
+                        self._range_cache.popitem(last=False)
             
-            return result_df
+            return result_df.copy(deep=True)
             
         except Exception as e:
             print(f"Error in batch prediction: {e}")
@@ -125,6 +699,10 @@ class EnergyForecastingModel:
         """Get feature importance from the model"""
         return self.config['feature_importance']
     
+    def get_sorted_feature_importance(self):
+        """Get (features, importance) arrays sorted from least to most important"""
+        return self._fi_sorted
+    
     def get_model_info(self):
         """Get model information"""
         return {
@@ -134,10 +712,104 @@ class EnergyForecastingModel:
             'created_date': self.config['created_date']
         }
 
-def create_prediction_chart(df, title="Energy Consumption Prediction"):
-    """Create a prediction chart"""
-    plt.style.use('fivethirtyeight')
-    fig, ax = plt.subplots(figsize=(12, 6))
+def bucket_stats(keys, values, minlength):
+    """Per-bucket mean and sample std of values grouped by small integer keys.
+    
+    Equivalent to ``groupby(keys).agg(['mean', 'std']).to_dict()`` but built
+    from np.bincount; only buckets that actually occur are returned.
+    """
+    keys = np.asarray(keys, dtype=np.intp)
+    values = np.asarray(values, dtype=np.float64)
+    
+    counts = np.bincount(keys, minlength=minlength)
+    sums = np.bincount(keys, weights=values, minlength=minlength)
+    sq_sums = np.bincount(keys, weights=values * values, minlength=minlength)
+    
+    present = np.flatnonzero(counts)
+    n = counts[present]
+    mean = sums[present] / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = (sq_sums[present] - n * mean * mean) / (n - 1)
+    std = np.sqrt(np.maximum(var, 0.0))
+    std[n < 2] = np.nan
+    
+    buckets = present.tolist()
+    return {
+        'mean': dict(zip(buckets, mean.tolist())),
+        'std': dict(zip(buckets, std.tolist()))
+    }
+
+def bucket_means(keys, values, minlength):
+    """Per-bucket mean of values grouped by small integer keys.
+    
+    Equivalent to ``groupby(keys).mean()`` for the buckets that occur, but
+    built from two np.bincount passes instead of pandas group indexers.
+    """
+    keys = np.asarray(keys, dtype=np.intp)
+    counts = np.bincount(keys, minlength=minlength)
+    sums = np.bincount(keys, weights=np.asarray(values, dtype=np.float64), minlength=minlength)
+    present = np.flatnonzero(counts)
+    return pd.Series(sums[present] / counts[present], index=present)
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def hourly_pattern(df):
+    """Average prediction for each hour of the day"""
+    return bucket_means(df.index.hour, df['prediction'].to_numpy(), 24)
+
+def weekly_pattern(df):
+    """Average prediction for each day of the week, indexed by day name"""
+    weekly_avg = bucket_means(df.index.dayofweek, df['prediction'].to_numpy(), 7)
+    weekly_avg.index = [DAY_NAMES[day] for day in weekly_avg.index]
+    return weekly_avg
+
+# Figure size (inches) of each chart type
+CHART_SIZES = {
+    'prediction': (12, 6),
+    'feature_importance': (10, 6),
+    'hourly': (12, 6),
+    'weekly': (12, 6)
+}
+
+@lru_cache(maxsize=None)
+def _chart_backend():
+    """Import matplotlib on first use and return (Figure, FigureCanvasAgg).
+    
+    Processes that never draw a chart never load the plotting stack. The
+    Agg backend and the chart style are set up once, here, instead of
+    re-reading the style file per chart.
+    """
+    import matplotlib
+    matplotlib.use('Agg')  # Charts are rendered off-screen, never shown
+    import matplotlib.style
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    
+    matplotlib.style.use('fivethirtyeight')
+    return Figure, FigureCanvasAgg
+
+def new_chart_figure(kind, dpi=None):
+    """Create an empty, styled figure sized for a chart type.
+    
+    Figures are built directly on an Agg canvas rather than through pyplot,
+    so they never enter pyplot's global figure registry.
+    """
+    Figure, FigureCanvasAgg = _chart_backend()
+    fig = Figure(figsize=CHART_SIZES[kind], dpi=dpi)
+    FigureCanvasAgg(fig)
+    return fig
+
+def _chart_axes(kind, fig=None):
+    """Return (fig, ax) for a chart, reusing fig when one is supplied"""
+    if fig is None:
+        fig = new_chart_figure(kind)
+    else:
+        fig.clear()
+    return fig, fig.subplots()
+
+def create_prediction_chart(df, title="Energy Consumption Prediction", fig=None):
+    """Create a prediction chart, drawing onto fig if given"""
+    fig, ax = _chart_axes('prediction', fig)
     
     # Plot predictions
     ax.plot(df.index, df['prediction'], 
@@ -153,36 +825,69 @@ def create_prediction_chart(df, title="Energy Consumption Prediction"):
     ax.legend()
     ax.grid(True, alpha=0.3)
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
-def create_feature_importance_chart(feature_importance):
-    """Create feature importance chart"""
-    plt.style.use('fivethirtyeight')
-    fig, ax = plt.subplots(figsize=(10, 6))
+def _sorted_importance(feature_importance):
+    """Sorted (features, importance) arrays from a dict, a model or a presorted tuple"""
+    if isinstance(feature_importance, EnergyForecastingModel):
+        return feature_importance.get_sorted_feature_importance()
+    if isinstance(feature_importance, tuple):
+        return feature_importance
+    return sort_feature_importance(feature_importance)
+
+def create_feature_importance_chart(feature_importance, fig=None):
+    """Create feature importance chart, drawing onto fig if given.
     
-    features = list(feature_importance.keys())
-    importance = list(feature_importance.values())
+    feature_importance is a dict, or a model or its sorted
+    (features, importance) tuple to skip sorting again.
+    """
+    fig, ax = _chart_axes('feature_importance', fig)
     
-    # Sort by importance
-    sorted_idx = np.argsort(importance)
-    features = [features[i] for i in sorted_idx]
-    importance = [importance[i] for i in sorted_idx]
+    features, importance = _sorted_importance(feature_importance)
     
     ax.barh(features, importance, color='steelblue')
     ax.set_title('Feature Importance', fontsize=16, fontweight='bold')
     ax.set_xlabel('Importance', fontsize=12)
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
-def create_hourly_pattern_chart(df):
-    """Create hourly pattern chart"""
-    plt.style.use('fivethirtyeight')
-    fig, ax = plt.subplots(figsize=(12, 6))
+def render_feature_importance_png(feature_importance, width=600, bar_height=30, row_height=40):
+    """Render the feature importance bar chart straight to PNG bytes with Pillow.
+    
+    The chart has a fixed shape, so it skips matplotlib's Figure/Artist
+    graph entirely; meant to be rendered once and served as cached bytes.
+    feature_importance is accepted in any form create_feature_importance_chart
+    takes.
+    """
+    features, importance = _sorted_importance(feature_importance)
+    items = list(zip(features[::-1].tolist(), importance[::-1].tolist()))
+    label_width, value_width, top = 100, 60, 40
+    max_bar = width - label_width - value_width
+    max_importance = max((float(v) for _, v in items), default=0.0) or 1.0
+    
+    img = Image.new('RGB', (width, top + row_height * len(items) + 10), 'white')
+    draw = ImageDraw.Draw(img)
+    draw.text((10, 10), 'Feature Importance', fill='black')
+    
+    for i, (feature, importance) in enumerate(items):
+        y = top + i * row_height
+        bar_end = label_width + int(max_bar * float(importance) / max_importance)
+        draw.text((10, y + bar_height // 3), str(feature), fill='black')
+        draw.rectangle([(label_width, y), (bar_end, y + bar_height)], fill='steelblue')
+        draw.text((bar_end + 5, y + bar_height // 3), f'{float(importance):.3f}', fill='black')
+    
+    buffer = BytesIO()
+    img.save(buffer, 'PNG', optimize=False)
+    return buffer.getvalue()
+
+def create_hourly_pattern_chart(df, fig=None):
+    """Create hourly pattern chart, drawing onto fig if given"""
+    fig, ax = _chart_axes('hourly', fig)
     
     # Group by hour and calculate mean
-    hourly_avg = df.groupby(df.index.hour)['prediction'].mean()
+    hourly_avg = hourly_pattern(df)
     
     ax.plot(hourly_avg.index, hourly_avg.values, 
            marker='o', linewidth=2, markersize=6, color='green')
@@ -193,25 +898,22 @@ def create_hourly_pattern_chart(df):
     ax.set_xticks(range(0, 24, 2))
     ax.grid(True, alpha=0.3)
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
 
-def create_weekly_pattern_chart(df):
-    """Create weekly pattern chart"""
-    plt.style.use('fivethirtyeight')
-    fig, ax = plt.subplots(figsize=(12, 6))
+def create_weekly_pattern_chart(df, fig=None):
+    """Create weekly pattern chart, drawing onto fig if given"""
+    fig, ax = _chart_axes('weekly', fig)
     
     # Group by day of week and calculate mean
-    weekly_avg = df.groupby(df.index.dayofweek)['prediction'].mean()
-    
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+    weekly_avg = weekly_pattern(df)
     
-    ax.bar(days, weekly_avg.values, color='orange', alpha=0.7)
+    ax.bar(weekly_avg.index, weekly_avg.values, color='orange', alpha=0.7)
     
     ax.set_title('Average Energy Consumption by Day of Week', fontsize=16, fontweight='bold')
     ax.set_xlabel('Day of Week', fontsize=12)
     ax.set_ylabel('Average Energy Consumption (MW)', fontsize=12)
     ax.tick_params(axis='x', rotation=45)
     
-    plt.tight_layout()
+    fig.tight_layout()
     return fig
\ No newline at end of file